@@ -2,20 +2,58 @@ import streamlit as st
 import pandas as pd
 import numpy as np
 import folium
+from folium.plugins import FastMarkerCluster
 from streamlit_folium import folium_static
 import os
+import time
+import html
 from dotenv import load_dotenv
 import json
 from utils.routing import (
     geocode_location, 
     get_route_between_locations, 
-    calculate_shortest_paths_dijkstra,
-    format_duration
+    iter_shortest_paths_dijkstra,
+    iter_prize_collecting_route,
+    format_duration,
+    Deadline,
+    STAGE_BUDGET_SHARES
+)
+from utils.cache import DiskCache, plan_fingerprint
+from utils.geometry import (
+    to_coordinate_array,
+    fit_zoom,
+    zoom_tolerance,
+    simplify_polyline,
+    route_geojson,
+    ROUTE_DETAIL_ZOOM_LEVELS
 )
 
 # Load environment variables
 load_dotenv()
 
+# Parcel selection and routing strategies
+TWO_STAGE_MODE = "Two-stage (Knapsack + Branch and Bound)"
+JOINT_MODE = "Joint (Prize-collecting TSP)"
+
+# Settings that change the plan for identical inputs; part of the plan cache key
+PLAN_SETTINGS = {
+    'profile': 'driving-car'
+}
+
+# Minimum time between redraws of the live route while searching (seconds)
+LIVE_REFRESH_SECONDS = 1.0
+
+# Number of stops above which map markers are clustered
+MARKER_CLUSTER_THRESHOLD = 25
+
+# Builds a clustered stop marker from a [lat, lng, popup, color] row
+CLUSTER_MARKER_CALLBACK = """
+function (row) {
+    var icon = L.AwesomeMarkers.icon({icon: 'info-sign', markerColor: row[3], prefix: 'glyphicon'});
+    return L.marker(new L.LatLng(row[0], row[1]), {icon: icon}).bindPopup(row[2]);
+}
+"""
+
 # Set page configuration
 st.set_page_config(
     page_title="Intelligent Parcel Delivery System",
@@ -71,6 +109,17 @@ st.markdown("""
 </style>
 """, unsafe_allow_html=True)
 
+@st.cache_resource
+def get_plan_cache():
+    """
+    Cache of finished plans, keyed by a fingerprint of the inputs. Created
+    once per process, since the script itself reruns on every interaction.
+    
+    Returns:
+        DiskCache of plans
+    """
+    return DiskCache('plans', max_entries=200)
+
 def merge_sort(arr):
     """
     Implementation of merge sort algorithm to sort parcels by value/weight ratio.
@@ -191,41 +240,380 @@ def display_route_map(locations, route_coordinates):
     """
     Display a map with the optimized route using Folium.
     
+    The route is simplified to the detail visible at the zoom level that fits
+    it and sent as compact GeoJSON; large stop sets are clustered.
+    
     Args:
         locations: List of location data including coordinates
-        route_coordinates: List of coordinates for the route
+        route_coordinates: Array or list of (latitude, longitude) for the route
     """
+    route_coordinates = to_coordinate_array(route_coordinates)
+    stop_coordinates = to_coordinate_array([[loc['lat'], loc['lng']] for loc in locations])
+    all_coordinates = np.concatenate([stop_coordinates, route_coordinates])
+    
     # Create a folium map centered at the first location
     m = folium.Map(location=[locations[0]['lat'], locations[0]['lng']], 
                    zoom_start=10, 
                    tiles="CartoDB dark_matter")
+    if len(all_coordinates) > 1:
+        m.fit_bounds([all_coordinates.min(axis=0).tolist(), all_coordinates.max(axis=0).tolist()])
     
     # Add markers for each location
+    markers = []
     for i, loc in enumerate(locations):
         popup_text = f"Location {i+1}: {loc['city']}"
         if i > 0 and 'fraction' in loc and loc['fraction'] < 1.0:
             popup_text += f" ({loc['fraction']*100:.1f}%)"
             
         icon_color = 'red' if i == 0 else ('green' if i == len(locations)-1 else 'blue')
-        
-        folium.Marker(
-            [loc['lat'], loc['lng']],
-            popup=popup_text,
-            icon=folium.Icon(color=icon_color, icon='info-sign')
-        ).add_to(m)
+        # City names come from uploaded files; neither marker path escapes popups
+        markers.append([float(loc['lat']), float(loc['lng']), html.escape(popup_text), icon_color])
+    
+    if len(markers) > MARKER_CLUSTER_THRESHOLD:
+        # Ship the stops as one data array and build the markers in the browser
+        FastMarkerCluster(markers, callback=CLUSTER_MARKER_CALLBACK).add_to(m)
+    else:
+        for lat, lng, popup_text, icon_color in markers:
+            folium.Marker(
+                [lat, lng],
+                popup=popup_text,
+                icon=folium.Icon(color=icon_color, icon='info-sign')
+            ).add_to(m)
     
-    # Add the route as a polyline
-    if route_coordinates and len(route_coordinates) > 1:
-        folium.PolyLine(
-            route_coordinates,
-            weight=5,
-            color='blue',
-            opacity=0.8
+    # Add the simplified route as a GeoJSON line
+    if len(route_coordinates) > 1:
+        zoom = fit_zoom(all_coordinates) + ROUTE_DETAIL_ZOOM_LEVELS
+        simplified = simplify_polyline(route_coordinates, zoom_tolerance(zoom))
+        folium.GeoJson(
+            route_geojson(simplified),
+            style_function=lambda feature: {
+                'weight': 5,
+                'color': 'blue',
+                'opacity': 0.8
+            }
         ).add_to(m)
     
     # Display the map
     folium_static(m)
 
+def overall_progress(stage, progress):
+    """
+    Position of the progress bar for progress within a pipeline stage, where
+    each stage takes up its share of the planning budget.
+    
+    Args:
+        stage: Stage name, a key of STAGE_BUDGET_SHARES
+        progress: Share of the stage done (0 to 1)
+        
+    Returns:
+        Overall progress (0 to 1)
+    """
+    start = 0.0
+    for name, share in STAGE_BUDGET_SHARES.items():
+        if name == stage:
+            return min(1.0, start + share * min(progress, 1.0))
+        start += share
+    return 1.0
+
+def build_plan(parcels_df, max_weight, start_city, time_budget, settings):
+    """
+    Run the full planning pipeline: geocoding, parcel selection and route optimization.
+    
+    Args:
+        parcels_df: DataFrame of parcels with id, city, weight and value
+        max_weight: Maximum total weight that can be carried
+        start_city: Name of the starting city
+        time_budget: Planning time budget in seconds
+        settings: Plan settings with the optimization mode and travel costs
+        
+    Returns:
+        Plan dictionary, or None if no plan could be made (the error is shown)
+    """
+    # Bound the whole plan; each stage gets a share of the budget
+    deadline = Deadline(time_budget)
+    geocode_deadline = deadline.stage('geocode')
+    
+    # Step 1: Geocode all locations including the starting point
+    locations = []
+    skipped_cities = []
+    progress_bar = st.progress(0.0, text="Geocoding locations...")
+    
+    # Add starting location first
+    start_location = geocode_location(start_city, timeout=geocode_deadline.request_timeout())
+    if start_location:
+        locations.append({
+            'id': 0,
+            'city': start_city,
+            'lat': start_location[0],
+            'lng': start_location[1]
+        })
+    else:
+        progress_bar.empty()
+        st.error(f"Could not geocode starting city: {start_city}")
+        return None
+    
+    # Geocode all parcel locations
+    for done, (_, row) in enumerate(parcels_df.iterrows()):
+        progress_bar.progress(overall_progress('geocode', done / len(parcels_df)), text="Geocoding locations...")
+        if geocode_deadline.expired():
+            st.warning(f"Geocoding time budget exhausted, skipping city: {row['city']}")
+            skipped_cities.append(row['city'])
+            continue
+        location = geocode_location(row['city'], timeout=geocode_deadline.request_timeout())
+        if location:
+            locations.append({
+                'id': row['id'],
+                'city': row['city'],
+                'lat': location[0],
+                'lng': location[1],
+                'weight': row['weight'],
+                'value': row['value']
+            })
+        else:
+            st.warning(f"Could not geocode city: {row['city']}")
+            skipped_cities.append(row['city'])
+    
+    if settings['mode'] == JOINT_MODE:
+        # Step 2: Choose parcels and their delivery order together
+        route_locations = locations
+        selected_parcels_list = None
+        events = iter_prize_collecting_route(locations, max_weight, settings['cost_per_km'], settings['cost_per_hour'], deadline)
+    else:
+        # Step 2: Apply Fractional Greedy Knapsack algorithm to select parcels
+        locations_df = pd.DataFrame(locations[1:])  # Exclude starting point
+        
+        # Convert DataFrame to list of dictionaries for fractional greedy knapsack
+        parcels_list = locations_df.to_dict('records')
+        selected_parcels_list = fractional_greedy_knapsack(parcels_list, max_weight)
+        
+        if not selected_parcels_list:
+            progress_bar.empty()
+            st.error("No parcels could be selected within the weight constraint.")
+            return None
+        
+        # Create a list of selected locations (including start point)
+        selected_locations = [locations[0]]  # Starting point
+        for parcel in selected_parcels_list:
+            # Make a copy of the location and add fraction data
+            location_copy = locations[parcel['original_index'] + 1].copy()
+            location_copy['fraction'] = parcel['fraction']
+            location_copy['actual_weight'] = parcel['actual_weight']
+            location_copy['actual_value'] = parcel['actual_value']
+            selected_locations.append(location_copy)
+        
+        # Step 3: Apply Branch and Bound algorithm for TSP
+        # Include only the starting location and selected parcels
+        route_locations = selected_locations
+        events = iter_shortest_paths_dijkstra(selected_locations, deadline)
+    
+    # Stream the search: show progress and the best route so far, which
+    # dispatchers can accept with the stop button
+    stop_button = st.empty()
+    stop_button.button("Stop and use best route so far", key="stop_search", on_click=cancel_search)
+    live_route = st.empty()
+    plan = None
+    last_refresh = 0.0
+    for event in events:
+        if event['stage'] == 'matrix':
+            progress_bar.progress(overall_progress('matrix', event['progress']), text="Fetching distances between locations...")
+            continue
+        if event['stage'] == 'geometry':
+            progress_bar.progress(overall_progress('geometry', event['progress']), text="Fetching road geometry of the route...")
+            continue
+        
+        plan = make_plan(event['result'], route_locations, selected_parcels_list, skipped_cities)
+        st.session_state['partial_plan'] = plan
+        
+        if event['stage'] == 'solver' and time.monotonic() - last_refresh >= LIVE_REFRESH_SECONDS:
+            last_refresh = time.monotonic()
+            solver_progress = event['progress'] if event['progress'] is not None else 0.5
+            progress_bar.progress(overall_progress('solver', solver_progress),
+                                  text=f"Improving route, best so far: {plan['total_distance']:.2f} km")
+            if len(plan['ordered_visits']) > 1:
+                with live_route.container():
+                    display_route_map(plan['ordered_visits'], plan['route_coordinates'])
+    
+    stop_button.empty()
+    live_route.empty()
+    progress_bar.empty()
+    
+    if plan is None:
+        st.error("Could not calculate routes between locations. Please check your locations and try again.")
+        return None
+    if not plan['selected_parcels']:
+        st.error("No parcel is worth its detour at the given travel costs.")
+        return None
+    return plan
+
+def make_plan(result, route_locations, selected_parcels_list, skipped_cities):
+    """
+    Build a plan dictionary from a route result of the planning pipeline.
+    
+    Args:
+        result: Route result tuple from iter_shortest_paths_dijkstra or iter_prize_collecting_route
+        route_locations: Locations the route was planned over
+        selected_parcels_list: Parcels chosen by the knapsack, or None if the
+                               route itself chose them
+        skipped_cities: Cities that could not be geocoded
+        
+    Returns:
+        Plan dictionary
+    """
+    shortest_paths, total_distance, ordered_visits, route_coordinates, total_duration, approximations = result
+    
+    if selected_parcels_list is None:
+        selected_parcels_list = []
+        for visit in ordered_visits[1:]:
+            selected_parcels_list.append({
+                'id': visit['id'],
+                'city': visit['city'],
+                'weight': visit['weight'],
+                'value': visit['value'],
+                'fraction': 1.0,
+                'actual_weight': visit['weight'],
+                'actual_value': visit['value']
+            })
+    
+    # Legs in visiting order; their geometry is already part of route_coordinates
+    position = {id(loc): k for k, loc in enumerate(route_locations)}
+    ordered_indices = [position[id(visit)] for visit in ordered_visits]
+    route_legs = []
+    for from_idx, to_idx in zip(ordered_indices[:-1], ordered_indices[1:]):
+        leg = shortest_paths[from_idx][to_idx]
+        route_legs.append({'distance': leg['distance'], 'duration': leg['duration']})
+    
+    return {
+        'selected_parcels': selected_parcels_list,
+        'skipped_cities': skipped_cities,
+        'route_legs': route_legs,
+        'total_distance': total_distance,
+        'total_duration': total_duration,
+        'ordered_visits': ordered_visits,
+        'route_coordinates': route_coordinates,
+        'approximations': approximations,
+        'cancelled': False
+    }
+
+def cancel_search():
+    """
+    Stop button callback. The click reruns the script, which interrupts the
+    running search; the flag tells the rerun to show the best plan found.
+    """
+    st.session_state['search_cancelled'] = True
+
+def is_exact_plan(plan):
+    """
+    Check whether a plan was computed without any degradation, so it is
+    safe to reuse for identical inputs.
+    
+    Args:
+        plan: Plan dictionary from build_plan
+        
+    Returns:
+        True if nothing in the plan was skipped or approximated
+    """
+    approximations = plan['approximations']
+    return (not plan['skipped_cities']
+            and not approximations['estimated_legs']
+            and not approximations['missing_geometry']
+            and not approximations['ors_unavailable']
+            and approximations['route_optimal'])
+
+def display_plan(plan, parcels_df, max_weight):
+    """
+    Display the selected parcels, route summary, route details and map of a plan.
+    
+    Args:
+        plan: Plan dictionary from build_plan
+        parcels_df: DataFrame of all parcels
+        max_weight: Maximum total weight that can be carried
+    """
+    # Convert selected parcels to DataFrame for display
+    selected_parcels_df = pd.DataFrame(plan['selected_parcels'])
+    
+    # Add percentage column for clarity
+    selected_parcels_df['Percentage'] = selected_parcels_df['fraction'] * 100
+    
+    # Format display DataFrame
+    display_df = selected_parcels_df[['id', 'city', 'weight', 'value', 'fraction', 'actual_weight', 'actual_value', 'Percentage']]
+    display_df.columns = ['ID', 'City', 'Total Weight', 'Total Value', 'Fraction', 'Actual Weight', 'Actual Value', 'Percentage (%)']
+    
+    # Calculate totals
+    total_actual_weight = selected_parcels_df['actual_weight'].sum()
+    total_actual_value = selected_parcels_df['actual_value'].sum()
+    
+    st.subheader("Selected Parcels")
+    st.markdown(f"""
+    <div class="success-box">
+        <p>Optimally selected {len(selected_parcels_df)} parcels/partial parcels out of {len(parcels_df)} available.</p>
+        <p>Total Weight: {total_actual_weight:.2f} kg out of {max_weight:.2f} kg maximum.</p>
+        <p>Total Value: ${total_actual_value:.2f}</p>
+    </div>
+    """, unsafe_allow_html=True)
+    st.dataframe(display_df)
+    
+    st.subheader("Shortest Paths Between Selected Cities")
+    
+    ordered_visits = plan['ordered_visits']
+    approximations = plan['approximations']
+    
+    # Create a version of the route with fractions shown for display
+    display_route = []
+    for loc in ordered_visits:
+        city_name = loc['city']
+        if 'fraction' in loc and loc['fraction'] < 1.0:
+            city_name += f" ({loc['fraction']*100:.1f}%)"
+        display_route.append(city_name)
+    
+    st.markdown(f"""
+    <div class="stats-box">
+        <p>Total Distance: {plan['total_distance']:.2f} km</p>
+        <p>Estimated Total Duration: {format_duration(plan['total_duration'])}</p>
+        <p>Delivery Sequence: {' → '.join(display_route)}</p>
+    </div>
+    """, unsafe_allow_html=True)
+    
+    # Report which parts of the plan are estimates
+    notes = []
+    if approximations['ors_unavailable']:
+        notes.append("OpenRouteService is unavailable, road distances were estimated")
+    if approximations['estimated_legs']:
+        notes.append(f"{len(approximations['estimated_legs'])} route legs use straight-line estimates")
+    if approximations.get('missing_geometry'):
+        notes.append(f"{len(approximations['missing_geometry'])} route legs are drawn as straight lines on the map")
+    # A stopped search is reported by the caller; the budget did not run out
+    if not approximations['route_optimal'] and not plan.get('cancelled'):
+        notes.append("Time budget expired, showing the best route found so far")
+    if notes:
+        st.markdown(f"""
+        <div class="warning-box">
+            <p>{'</p><p>'.join(notes)}</p>
+        </div>
+        """, unsafe_allow_html=True)
+    
+    # Display the route details
+    st.subheader("Delivery Route Details")
+    route_details = []
+    
+    for i, leg in enumerate(plan['route_legs']):
+        from_city = ordered_visits[i]['city']
+        to_city = ordered_visits[i + 1]['city']
+        if 'fraction' in ordered_visits[i + 1] and ordered_visits[i + 1]['fraction'] < 1.0:
+            to_city += f" ({ordered_visits[i + 1]['fraction']*100:.1f}%)"
+        
+        route_details.append({
+            "From": from_city,
+            "To": to_city,
+            "Distance (km)": f"{leg['distance']:.2f}",
+            "Duration": format_duration(leg['duration'])
+        })
+    
+    st.table(pd.DataFrame(route_details))
+    
+    # Display route on map
+    st.subheader("Delivery Route Map")
+    display_route_map(ordered_visits, plan['route_coordinates'])
+
 def main():
     st.title("📦 Intelligent Parcel Delivery System")
     
@@ -236,6 +624,7 @@ def main():
         <li>Fractional Greedy Knapsack algorithm for optimal parcel selection</li>
         <li>Merge Sort algorithm for sorting parcels by value/weight ratio</li>
         <li>Branch and Bound algorithm for route optimization (TSP)</li>
+        <li>Prize-collecting TSP local search for joint parcel selection and routing</li>
         <li>Real-world routing using OpenRouteService API</li>
     </ul>
     </div>
@@ -317,6 +706,27 @@ def main():
                                      max_value=2000.0, 
                                      value=30.0, 
                                      step=1.0)
+        time_budget = st.number_input("Planning Time Budget (s)",
+                                      min_value=5,
+                                      max_value=300,
+                                      value=30,
+                                      step=5)
+        
+        # Optimization strategy
+        st.subheader("Optimization Mode")
+        optimization_mode = st.radio("Parcel Selection and Routing", [TWO_STAGE_MODE, JOINT_MODE])
+        plan_settings = dict(PLAN_SETTINGS, mode=optimization_mode)
+        if optimization_mode == JOINT_MODE:
+            plan_settings['cost_per_km'] = st.number_input("Cost per km ($)",
+                                                           min_value=0.0,
+                                                           max_value=100.0,
+                                                           value=0.5,
+                                                           step=0.1)
+            plan_settings['cost_per_hour'] = st.number_input("Cost per Hour ($)",
+                                                             min_value=0.0,
+                                                             max_value=1000.0,
+                                                             value=25.0,
+                                                             step=5.0)
         
         # Starting city
         st.subheader("Starting Location")
@@ -331,148 +741,38 @@ def main():
         st.dataframe(parcels_df)
         
         if optimize_button:
+            st.session_state.pop('partial_plan', None)
             with st.spinner("Optimizing delivery route..."):
                 try:
-                    # Step 1: Geocode all locations including the starting point
-                    locations = []
+                    # Identical inputs reuse the stored plan instead of re-running the pipeline
+                    plan_key = plan_fingerprint(parcels_df.to_dict('records'), max_weight, start_city, plan_settings)
+                    plan_cache = get_plan_cache()
+                    plan = plan_cache.get(plan_key)
                     
-                    # Add starting location first
-                    start_location = geocode_location(start_city)
-                    if start_location:
-                        locations.append({
-                            'id': 0,
-                            'city': start_city,
-                            'lat': start_location[0],
-                            'lng': start_location[1]
-                        })
+                    if plan:
+                        st.info("Showing the stored plan for identical inputs.")
                     else:
-                        st.error(f"Could not geocode starting city: {start_city}")
-                        return
-                    
-                    # Geocode all parcel locations
-                    for _, row in parcels_df.iterrows():
-                        location = geocode_location(row['city'])
-                        if location:
-                            locations.append({
-                                'id': row['id'],
-                                'city': row['city'],
-                                'lat': location[0],
-                                'lng': location[1],
-                                'weight': row['weight'],
-                                'value': row['value']
-                            })
-                        else:
-                            st.warning(f"Could not geocode city: {row['city']}")
+                        plan = build_plan(parcels_df, max_weight, start_city, time_budget, plan_settings)
+                        if plan is None:
+                            return
+                        if is_exact_plan(plan):
+                            plan_cache.set(plan_key, plan)
                     
-                    # Step 2: Apply Fractional Greedy Knapsack algorithm to select parcels
-                    locations_df = pd.DataFrame(locations[1:])  # Exclude starting point
-                    
-                    # Convert DataFrame to list of dictionaries for fractional greedy knapsack
-                    parcels_list = locations_df.to_dict('records')
-                    selected_parcels_list = fractional_greedy_knapsack(parcels_list, max_weight)
-                    
-                    if not selected_parcels_list:
-                        st.error("No parcels could be selected within the weight constraint.")
-                        return
-                    
-                    # Create a list of selected locations (including start point)
-                    selected_locations = [locations[0]]  # Starting point
-                    for parcel in selected_parcels_list:
-                        # Make a copy of the location and add fraction data
-                        location_copy = locations[parcel['original_index'] + 1].copy()
-                        location_copy['fraction'] = parcel['fraction']
-                        location_copy['actual_weight'] = parcel['actual_weight']
-                        location_copy['actual_value'] = parcel['actual_value']
-                        selected_locations.append(location_copy)
-                    
-                    # Convert selected parcels to DataFrame for display
-                    selected_parcels_df = pd.DataFrame(selected_parcels_list)
-                    
-                    # Add percentage column for clarity
-                    selected_parcels_df['Percentage'] = selected_parcels_df['fraction'] * 100
-                    
-                    # Format display DataFrame
-                    display_df = selected_parcels_df[['id', 'city', 'weight', 'value', 'fraction', 'actual_weight', 'actual_value', 'Percentage']]
-                    display_df.columns = ['ID', 'City', 'Total Weight', 'Total Value', 'Fraction', 'Actual Weight', 'Actual Value', 'Percentage (%)']
-                    
-                    # Calculate totals
-                    total_actual_weight = selected_parcels_df['actual_weight'].sum()
-                    total_actual_value = selected_parcels_df['actual_value'].sum()
-                    
-                    st.subheader("Selected Parcels")
-                    st.markdown(f"""
-                    <div class="success-box">
-                        <p>Optimally selected {len(selected_parcels_df)} parcels/partial parcels out of {len(parcels_df)} available.</p>
-                        <p>Total Weight: {total_actual_weight:.2f} kg out of {max_weight:.2f} kg maximum.</p>
-                        <p>Total Value: ${total_actual_value:.2f}</p>
-                    </div>
-                    """, unsafe_allow_html=True)
-                    st.dataframe(display_df)
-                    
-                    # Step 3: Apply Branch and Bound algorithm for TSP
-                    st.subheader("Shortest Paths Between Selected Cities")
-                    
-                    # Create graph from selected locations
-                    with st.spinner("Calculating shortest paths using Branch and Bound..."):
-                        # Include only the starting location and selected parcels
-                        shortest_paths, total_distance, ordered_visits, route_coordinates, total_duration = calculate_shortest_paths_dijkstra(selected_locations)
-                        
-                        # Display results
-                        if shortest_paths:
-                            # Create a version of the route with fractions shown for display
-                            display_route = []
-                            for loc in ordered_visits:
-                                city_name = loc['city']
-                                if 'fraction' in loc and loc['fraction'] < 1.0:
-                                    city_name += f" ({loc['fraction']*100:.1f}%)"
-                                display_route.append(city_name)
-                            
-                            st.markdown(f"""
-                            <div class="stats-box">
-                                <p>Total Distance: {total_distance:.2f} km</p>
-                                <p>Estimated Total Duration: {format_duration(total_duration)}</p>
-                                <p>Delivery Sequence: {' → '.join(display_route)}</p>
-                            </div>
-                            """, unsafe_allow_html=True)
-                            
-                            # Display the route details
-                            st.subheader("Delivery Route Details")
-                            route_details = []
-                            
-                            # Fix: Use ordered indices to access shortest_paths matrix
-                            ordered_indices = [i for i in range(len(ordered_visits))]
-                            
-                            for i in range(len(ordered_indices) - 1):
-                                from_idx = ordered_indices[i]
-                                to_idx = ordered_indices[i + 1]
-                                
-                                from_city = ordered_visits[i]['city']
-                                to_city = ordered_visits[i + 1]['city']
-                                if 'fraction' in ordered_visits[i + 1] and ordered_visits[i + 1]['fraction'] < 1.0:
-                                    to_city += f" ({ordered_visits[i + 1]['fraction']*100:.1f}%)"
-                                
-                                # Use the correct indices in the shortest_paths matrix
-                                segment_distance = shortest_paths[from_idx][to_idx]['distance']
-                                segment_duration = shortest_paths[from_idx][to_idx]['duration']
-                                
-                                route_details.append({
-                                    "From": from_city,
-                                    "To": to_city,
-                                    "Distance (km)": f"{segment_distance:.2f}",
-                                    "Duration": format_duration(segment_duration)
-                                })
-                            
-                            st.table(pd.DataFrame(route_details))
-                            
-                            # Display route on map
-                            st.subheader("Delivery Route Map")
-                            display_route_map(ordered_visits, route_coordinates)
-                        else:
-                            st.error("Could not calculate routes between locations. Please check your locations and try again.")
+                    display_plan(plan, parcels_df, max_weight)
                 
                 except Exception as e:
                     st.error(f"An error occurred during optimization: {str(e)}")
                     st.exception(e)
+        
+        elif st.session_state.pop('search_cancelled', False):
+            # The stop button interrupted the search; show the best plan it had found
+            plan = st.session_state.pop('partial_plan', None)
+            if plan and plan['selected_parcels']:
+                plan['cancelled'] = True
+                st.warning("Search stopped. Showing the best plan found so far.")
+                display_plan(plan, parcels_df, max_weight)
+            else:
+                st.info("Search stopped before a route was found.")
     
     # Footer
     st.markdown("---")
@@ -0,0 +1,193 @@
+import os
+import json
+import hashlib
+import tempfile
+import threading
+from collections import OrderedDict
+
+# Root directory for persistent caches, shared by the app and background jobs
+CACHE_DIR = os.getenv('CACHE_DIR', os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), '.cache'))
+
+# Default bound on the memory held by the in-memory level of each cache (bytes)
+MEMORY_BUDGET_BYTES = 64 * 1024 * 1024
+
+# Decoded JSON takes several times its text size in memory; a route leg's
+# coordinate list measures about 6.5 times
+DECODED_SIZE_FACTOR = 7
+
+def _to_builtin(value):
+    """
+    JSON fallback for NumPy arrays and scalars, which pandas hands back.
+    """
+    if hasattr(value, 'tolist'):
+        return value.tolist()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+def fingerprint(data):
+    """
+    Compute a stable hash of JSON-serializable data.
+
+    Args:
+        data: Data to hash; dictionary keys are sorted before hashing
+
+    Returns:
+        Hex digest string
+    """
+    canonical = json.dumps(data, sort_keys=True, separators=(',', ':'), default=_to_builtin)
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+def plan_fingerprint(parcels, max_weight, start_city, settings):
+    """
+    Canonical key of a delivery plan. Parcels are normalized and sorted so the
+    order of rows in the manifest and the letter case of city names do not
+    change the key.
+
+    Args:
+        parcels: List of parcel dictionaries with id, city, weight and value
+        max_weight: Maximum total weight that can be carried
+        start_city: Name of the starting city
+        settings: Dictionary of solver settings that affect the result
+
+    Returns:
+        Hex digest string
+    """
+    normalized = sorted(
+        [str(p['id']), str(p['city']).strip().lower(), round(float(p['weight']), 3), round(float(p['value']), 3)]
+        for p in parcels
+    )
+    return fingerprint({
+        'parcels': normalized,
+        'max_weight': round(float(max_weight), 3),
+        'start_city': start_city.strip().lower(),
+        'settings': settings
+    })
+
+class DiskCache:
+    """
+    Two-level key/value cache: an in-memory LRU in front of a directory of
+    JSON files. Both levels are bounded by max_entries and evict the least
+    recently used entries first; the memory level is also bounded by the
+    approximate size of its entries, estimated from their JSON encoding.
+
+    Instances are shared by all sessions of the app, so both indexes are
+    guarded by a lock; file I/O happens outside it.
+    """
+
+    def __init__(self, name, max_entries=1000, max_memory_bytes=MEMORY_BUDGET_BYTES, directory=CACHE_DIR):
+        self.max_entries = max_entries
+        self.max_memory_bytes = max_memory_bytes
+        self.memory = OrderedDict()
+        self.memory_bytes = 0
+        self.directory = os.path.join(directory, name) if directory else None
+        self.disk_index = OrderedDict()
+        self.lock = threading.Lock()
+
+        if self.directory:
+            try:
+                os.makedirs(self.directory, exist_ok=True)
+                entries = [e for e in os.scandir(self.directory) if e.name.endswith('.json')]
+                for entry in sorted(entries, key=lambda e: e.stat().st_mtime):
+                    self.disk_index[entry.name[:-len('.json')]] = True
+            except OSError as e:
+                print(f"Error opening cache directory: {e}")
+                self.directory = None
+
+    def _path(self, digest):
+        return os.path.join(self.directory, f"{digest}.json")
+
+    def get(self, key):
+        """
+        Look up a key, promoting disk hits into memory.
+
+        Args:
+            key: Any JSON-serializable key
+
+        Returns:
+            Cached value, or None on a miss
+        """
+        digest = fingerprint(key)
+        with self.lock:
+            entry = self.memory.get(digest)
+            if entry is not None:
+                self.memory.move_to_end(digest)
+                return entry[0]
+
+        # Other processes (such as the cache warming job) may have added the
+        # entry since the index was built, so look for the file itself
+        if self.directory:
+            try:
+                with open(self._path(digest)) as f:
+                    text = f.read()
+                value = json.loads(text)
+                os.utime(self._path(digest))
+            except (OSError, ValueError):
+                with self.lock:
+                    self.disk_index.pop(digest, None)
+                return None
+            with self.lock:
+                self.disk_index[digest] = True
+                self.disk_index.move_to_end(digest)
+                self._remember(digest, value, len(text))
+            return value
+
+        return None
+
+    def set(self, key, value):
+        """
+        Store a value in memory and on disk.
+
+        Args:
+            key: Any JSON-serializable key
+            value: JSON-serializable value
+        """
+        digest = fingerprint(key)
+        try:
+            text = json.dumps(value, default=_to_builtin)
+        except TypeError as e:
+            print(f"Error writing cache entry: {e}")
+            return
+        with self.lock:
+            self._remember(digest, value, len(text))
+
+        if not self.directory:
+            return
+        try:
+            # Write to a temporary file of our own first, so readers never see
+            # a partial entry and concurrent writers do not share a file
+            fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+            try:
+                with os.fdopen(fd, 'w') as f:
+                    f.write(text)
+                os.replace(tmp_path, self._path(digest))
+            except OSError:
+                os.remove(tmp_path)
+                raise
+        except OSError as e:
+            print(f"Error writing cache entry: {e}")
+            return
+
+        evicted = []
+        with self.lock:
+            self.disk_index[digest] = True
+            self.disk_index.move_to_end(digest)
+            while len(self.disk_index) > self.max_entries:
+                evicted.append(self.disk_index.popitem(last=False)[0])
+        for oldest in evicted:
+            try:
+                os.remove(self._path(oldest))
+            except OSError:
+                pass
+
+    def _remember(self, digest, value, text_size):
+        # Callers hold self.lock
+        if digest in self.memory:
+            self.memory_bytes -= self.memory.pop(digest)[1]
+        size = text_size * DECODED_SIZE_FACTOR
+        if size > self.max_memory_bytes:
+            # Too large to keep in memory; the disk level still holds it
+            return
+        self.memory[digest] = (value, size)
+        self.memory_bytes += size
+        while len(self.memory) > self.max_entries or self.memory_bytes > self.max_memory_bytes:
+            _, (_, evicted_size) = self.memory.popitem(last=False)
+            self.memory_bytes -= evicted_size
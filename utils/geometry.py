@@ -0,0 +1,130 @@
+import numpy as np
+from math import log2, floor, cos, radians
+
+# Size of a web map tile in pixels
+TILE_SIZE = 256
+
+# Extra zoom levels the simplified route should still look smooth at
+ROUTE_DETAIL_ZOOM_LEVELS = 2
+
+def to_coordinate_array(coordinates):
+    """
+    Convert route coordinates to an (N, 2) float array of (latitude, longitude).
+
+    Args:
+        coordinates: Array or list of (latitude, longitude) pairs
+
+    Returns:
+        NumPy array of shape (N, 2)
+    """
+    array = np.asarray(coordinates, dtype=float)
+    if array.size == 0:
+        return np.empty((0, 2))
+    return array.reshape(-1, 2)
+
+def fit_zoom(coordinates, map_width=700, map_height=500):
+    """
+    Find the largest web map zoom level at which all coordinates fit on the map.
+
+    Args:
+        coordinates: (N, 2) array of (latitude, longitude)
+        map_width: Map width in pixels
+        map_height: Map height in pixels
+
+    Returns:
+        Integer zoom level between 0 and 18
+    """
+    lat_span = np.ptp(coordinates[:, 0])
+    lng_span = np.ptp(coordinates[:, 1])
+    # Latitude degrees are stretched by the Mercator projection
+    lat_span /= max(cos(radians(np.mean(coordinates[:, 0]))), 0.01)
+    span = max(lat_span / map_height, lng_span / map_width)
+    if span <= 0:
+        return 18
+    return int(min(18, max(0, floor(log2(360 / (TILE_SIZE * span))))))
+
+def zoom_tolerance(zoom):
+    """
+    Simplification tolerance of one screen pixel at a zoom level, in degrees
+    of longitude.
+
+    Args:
+        zoom: Web map zoom level
+
+    Returns:
+        Tolerance in degrees of longitude
+    """
+    return 360 / (TILE_SIZE * 2 ** zoom)
+
+def simplify_polyline(coordinates, tolerance):
+    """
+    Simplify a polyline with the Douglas-Peucker algorithm. Distances to each
+    chord are computed for all points of a span at once with NumPy, and spans
+    are processed from an explicit stack rather than by recursion.
+
+    Args:
+        coordinates: (N, 2) array of (latitude, longitude)
+        tolerance: Maximum allowed deviation in degrees of longitude, as
+                   given by zoom_tolerance
+
+    Returns:
+        (M, 2) array with the retained points, endpoints always included
+    """
+    n = len(coordinates)
+    if n < 3:
+        return coordinates
+
+    # Scale longitude so both axes are in degrees of latitude, and the
+    # tolerance with it: on a Mercator map a pixel spans cos(latitude) times
+    # fewer degrees of latitude than of longitude
+    scale = cos(radians(float(np.mean(coordinates[:, 0]))))
+    points = coordinates * np.array([1.0, scale])
+    tolerance *= scale
+
+    keep = np.zeros(n, dtype=bool)
+    keep[0] = keep[-1] = True
+    stack = [(0, n - 1)]
+
+    while stack:
+        start, end = stack.pop()
+        if end - start < 2:
+            continue
+
+        chord = points[end] - points[start]
+        offsets = points[start + 1:end] - points[start]
+        chord_length = np.hypot(chord[0], chord[1])
+        if chord_length == 0:
+            distances = np.hypot(offsets[:, 0], offsets[:, 1])
+        else:
+            distances = np.abs(chord[0] * offsets[:, 1] - chord[1] * offsets[:, 0]) / chord_length
+
+        farthest = int(np.argmax(distances))
+        if distances[farthest] > tolerance:
+            split = start + 1 + farthest
+            keep[split] = True
+            stack.append((start, split))
+            stack.append((split, end))
+
+    return coordinates[keep]
+
+def route_geojson(coordinates, precision=5):
+    """
+    Build a compact GeoJSON LineString for a route.
+
+    Args:
+        coordinates: (N, 2) array of (latitude, longitude)
+        precision: Decimal places to keep (5 is about 1 m)
+
+    Returns:
+        GeoJSON Feature dictionary
+    """
+    # GeoJSON orders positions as (longitude, latitude)
+    positions = np.round(coordinates[:, ::-1], precision)
+    return {
+        'type': 'Feature',
+        'properties': {},
+        'geometry': {
+            'type': 'LineString',
+            'coordinates': positions.tolist()
+        }
+    }
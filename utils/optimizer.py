@@ -0,0 +1,241 @@
+import time
+import numpy as np
+from math import inf
+
+# Gains smaller than this are treated as no improvement
+MIN_GAIN = 1e-9
+
+# Longest time the search runs without reporting its best tour (seconds)
+REPORT_INTERVAL_SECONDS = 0.5
+
+def tour_profit(tour, cost_matrix, values):
+    """
+    Profit of a closed tour: value of the visited locations minus travel cost.
+
+    Args:
+        tour: Sequence of location indices starting at the depot (0)
+        cost_matrix: NumPy array of travel costs between all pairs of locations
+        values: NumPy array of location values
+
+    Returns:
+        Profit as a float
+    """
+    tour = np.asarray(tour)
+    return float(values[tour].sum() - cost_matrix[tour, np.roll(tour, -1)].sum())
+
+def _best_move(tour, cost_matrix, values, weights, in_tour, spare):
+    """
+    Evaluate every insert, remove, swap, relocate and 2-opt move of a tour at once.
+
+    Each move changes at most three edges (plus a prefix-sum lookup for 2-opt),
+    so its gain is computed in O(1) from the cost matrix; NumPy evaluates all
+    of them as whole matrices.
+
+    Returns:
+        Tuple of (gain, move, moves_evaluated) where move is None if no move improves the tour
+    """
+    C = cost_matrix
+    m = len(tour)
+    prev = np.roll(tour, 1)
+    nxt = np.roll(tour, -1)
+    # Cost of the edge leaving each position
+    edge = C[tour, nxt]
+    outside = np.flatnonzero(~in_tour)
+
+    best_gain, best_move, evaluated = MIN_GAIN, None, 0
+
+    # Insert an unvisited location into the edge leaving position p
+    if outside.size:
+        detour = C[np.ix_(tour, outside)] + C[np.ix_(outside, nxt)].T - edge[:, None]
+        gain = values[outside][None, :] - detour
+        gain[:, weights[outside] > spare + MIN_GAIN] = -inf
+        p, k = np.unravel_index(np.argmax(gain), gain.shape)
+        evaluated += gain.size
+        if gain[p, k] > best_gain:
+            best_gain, best_move = gain[p, k], ('insert', p, outside[k])
+
+    if m < 2:
+        return best_gain, best_move, evaluated
+
+    # Positions 1..m-1 hold the stops; the depot never moves
+    stops = tour[1:]
+    stop_prev = prev[1:]
+    stop_next = nxt[1:]
+    saving = C[stop_prev, stops] + C[stops, stop_next] - C[stop_prev, stop_next]
+
+    # Remove a stop
+    gain = saving - values[stops]
+    p = int(np.argmax(gain))
+    evaluated += gain.size
+    if gain[p] > best_gain:
+        best_gain, best_move = gain[p], ('remove', p + 1, None)
+
+    # Swap a stop for an unvisited location in the same position
+    if outside.size:
+        replace = (C[np.ix_(stop_prev, outside)] + C[np.ix_(outside, stop_next)].T
+                   - (C[stop_prev, stops] + C[stops, stop_next])[:, None])
+        gain = values[outside][None, :] - values[stops][:, None] - replace
+        gain[weights[outside][None, :] - weights[stops][:, None] > spare + MIN_GAIN] = -inf
+        p, k = np.unravel_index(np.argmax(gain), gain.shape)
+        evaluated += gain.size
+        if gain[p, k] > best_gain:
+            best_gain, best_move = gain[p, k], ('swap', p + 1, outside[k])
+
+    # Relocate a stop into another edge; the edges touching it are excluded
+    if m > 2:
+        detour = C[np.ix_(tour, stops)].T + C[np.ix_(stops, nxt)] - edge[None, :]
+        gain = saving[:, None] - detour
+        positions = np.arange(1, m)
+        gain[positions - 1, positions] = -inf
+        gain[positions - 1, positions - 1] = -inf
+        p, q = np.unravel_index(np.argmax(gain), gain.shape)
+        evaluated += gain.size
+        if gain[p, q] > best_gain:
+            best_gain, best_move = gain[p, q], ('relocate', p + 1, q)
+
+        # Reverse the stops between positions i and j (2-opt). Distances may be
+        # asymmetric, so the change in cost of the reversed inner edges comes
+        # from prefix sums of (reverse edge - forward edge).
+        reversal = np.concatenate(([0.0], np.cumsum(C[nxt, tour] - edge)))
+        inner = reversal[None, 1:m] - reversal[1:m, None]
+        gain = (C[stop_prev, stops][:, None] + edge[1:][None, :]
+                - C[np.ix_(stop_prev, stops)] - C[np.ix_(stops, stop_next)]
+                - inner)
+        gain[np.tril_indices(m - 1)] = -inf
+        i, j = np.unravel_index(np.argmax(gain), gain.shape)
+        evaluated += gain.size
+        if gain[i, j] > best_gain:
+            best_gain, best_move = gain[i, j], ('reverse', i + 1, j + 1)
+
+    return best_gain, best_move, evaluated
+
+def _apply_move(tour, move):
+    kind, p, arg = move
+    tour = list(tour)
+    if kind == 'insert':
+        tour.insert(p + 1, arg)
+    elif kind == 'remove':
+        del tour[p]
+    elif kind == 'swap':
+        tour[p] = arg
+    elif kind == 'reverse':
+        tour[p:arg + 1] = tour[p:arg + 1][::-1]
+    else:
+        node = tour[p]
+        # Insert after the node that starts edge q, looked up before removal
+        anchor = tour[arg]
+        del tour[p]
+        tour.insert(tour.index(anchor) + 1, node)
+    return np.array(tour, dtype=int)
+
+def _perturb(tour, cost_matrix, weights, max_weight, rng):
+    """
+    Kick a tour out of its local optimum: drop a few random stops, then force
+    a few random unvisited locations in at their cheapest positions. Forced
+    insertions let the search reach groups of nearby locations that only pay
+    off together.
+    """
+    C = cost_matrix
+    stop_count = len(tour) - 1
+    if stop_count:
+        drop_count = rng.integers(1, max(1, stop_count // 4) + 1)
+        tour = np.delete(tour, rng.choice(np.arange(1, len(tour)), size=drop_count, replace=False))
+
+    outside = np.setdiff1d(np.arange(1, len(C)), tour)
+    if outside.size:
+        add_count = rng.integers(1, max(1, outside.size // 2) + 1)
+        for node in rng.choice(outside, size=add_count, replace=False):
+            if weights[tour].sum() + weights[node] > max_weight:
+                continue
+            nxt = np.roll(tour, -1)
+            p = int(np.argmin(C[tour, node] + C[node, nxt] - C[tour, nxt]))
+            tour = np.insert(tour, p + 1, node)
+    return tour
+
+def _local_search(tour, cost_matrix, values, weights, max_weight, deadline, stats):
+    n = len(values)
+    while deadline is None or not deadline.expired():
+        in_tour = np.zeros(n, dtype=bool)
+        in_tour[tour] = True
+        spare = max_weight - weights[tour].sum()
+        _, move, evaluated = _best_move(tour, cost_matrix, values, weights, in_tour, spare)
+        stats['moves_evaluated'] += evaluated
+        if move is None:
+            return tour, True
+        tour = _apply_move(tour, move)
+    return tour, False
+
+def prize_collecting_tour(cost_matrix, values, weights, max_weight, deadline=None,
+                          max_rounds_without_improvement=50, seed=0):
+    """
+    Jointly choose which locations to visit and in what order, maximizing the
+    collected value minus the travel cost under a weight capacity
+    (prize-collecting TSP).
+
+    Uses iterated local search: best-improvement insert, remove, swap,
+    relocate and 2-opt moves until no move improves the tour, then a random
+    perturbation (dropping a few stops and forcing in a few unvisited
+    locations) and another descent. The best tour found is returned when the
+    deadline expires or after max_rounds_without_improvement perturbations in
+    a row fail.
+
+    Args:
+        cost_matrix: Matrix of travel costs between all pairs of locations
+        values: Value collected at each location (the depot's is ignored)
+        weights: Weight delivered at each location (the depot's is ignored)
+        max_weight: Maximum total weight that can be carried
+        deadline: Optional Deadline bounding the search
+        max_rounds_without_improvement: Stop after this many failed perturbations
+        seed: Seed for the perturbation random generator
+
+    Returns:
+        Tuple of (tour, profit, stats) where tour starts at the depot (0) and
+        stats has 'moves_evaluated', 'rounds' and 'timed_out'
+    """
+    for tour, profit, stats in iter_prize_collecting_tour(cost_matrix, values, weights, max_weight, deadline,
+                                                          max_rounds_without_improvement, seed):
+        pass
+    return tour, profit, stats
+
+def iter_prize_collecting_tour(cost_matrix, values, weights, max_weight, deadline=None,
+                               max_rounds_without_improvement=50, seed=0):
+    """
+    prize_collecting_tour as a generator. Yields (tour, profit, stats) for
+    the best tour found so far, whenever it improves and at least every
+    REPORT_INTERVAL_SECONDS while searching. Closing the generator cancels
+    the search.
+
+    Returns:
+        True if the search finished, False if the deadline expired
+    """
+    C = np.asarray(cost_matrix, dtype=float)
+    values = np.array(values, dtype=float)
+    weights = np.array(weights, dtype=float)
+    values[0] = 0
+    weights[0] = 0
+    rng = np.random.default_rng(seed)
+    stats = {'moves_evaluated': 0, 'rounds': 0, 'timed_out': False}
+
+    tour, finished = _local_search(np.array([0]), C, values, weights, max_weight, deadline, stats)
+    best_tour, best_profit = tour, tour_profit(tour, C, values)
+    last_report = time.monotonic()
+    yield best_tour.tolist(), best_profit, stats
+
+    failed_rounds = 0
+    while finished and failed_rounds < max_rounds_without_improvement:
+        stats['rounds'] += 1
+        tour = _perturb(best_tour, C, weights, max_weight, rng)
+        tour, finished = _local_search(tour, C, values, weights, max_weight, deadline, stats)
+        profit = tour_profit(tour, C, values)
+        if profit > best_profit + MIN_GAIN:
+            best_tour, best_profit = tour, profit
+            failed_rounds = 0
+        else:
+            failed_rounds += 1
+        if failed_rounds == 0 or time.monotonic() - last_report >= REPORT_INTERVAL_SECONDS:
+            last_report = time.monotonic()
+            yield best_tour.tolist(), best_profit, stats
+
+    stats['timed_out'] = not finished
+    yield best_tour.tolist(), best_profit, stats
+    return finished
@@ -1,20 +1,203 @@
 import os
+import time
 import requests
 import json
 import numpy as np
 import polyline
+from collections import deque
 from math import radians, sin, cos, sqrt, atan2, inf
+from utils.cache import DiskCache
+from utils.optimizer import iter_prize_collecting_tour
 
-def geocode_location(city_name):
+# Upper bound for a single OpenRouteService request (seconds)
+ORS_TIMEOUT_SECONDS = 10
+
+# Most matrix cells (sources x destinations) in one ORS matrix request
+ORS_MATRIX_MAX_CELLS = 3500
+
+# Longest time a search runs without reporting progress (seconds)
+PROGRESS_INTERVAL_SECONDS = 0.5
+
+# Share of the planning budget given to each stage of the pipeline
+STAGE_BUDGET_SHARES = {
+    'geocode': 0.2,
+    'matrix': 0.2,
+    'solver': 0.3,
+    'geometry': 0.3
+}
+
+class Deadline:
+    """
+    Wall-clock deadline for a planning run, measured with a monotonic clock.
+    A deadline of None seconds never expires.
+    """
+    
+    def __init__(self, seconds=None):
+        self.seconds = seconds
+        self.expires_at = None if seconds is None else time.monotonic() + seconds
+    
+    def remaining(self):
+        """
+        Returns:
+            Seconds left before the deadline (inf if unbounded)
+        """
+        if self.expires_at is None:
+            return inf
+        return max(0.0, self.expires_at - time.monotonic())
+    
+    def expired(self):
+        return self.remaining() <= 0
+    
+    def fraction_used(self):
+        """
+        Returns:
+            Share of the budget already spent (0 to 1), or None if unbounded
+        """
+        if self.expires_at is None:
+            return None
+        if self.seconds <= 0:
+            return 1.0
+        return 1.0 - self.remaining() / self.seconds
+    
+    def stage(self, name):
+        """
+        Carve a sub-deadline for a pipeline stage out of the remaining budget.
+        
+        Args:
+            name: Stage name, a key of STAGE_BUDGET_SHARES
+            
+        Returns:
+            Deadline for the stage
+        """
+        if self.expires_at is None:
+            return Deadline()
+        # Later stages get the time earlier stages did not use
+        later = False
+        pending_share = 0.0
+        for stage_name, share in STAGE_BUDGET_SHARES.items():
+            if stage_name == name:
+                later = True
+            if later:
+                pending_share += share
+        fraction = STAGE_BUDGET_SHARES[name] / pending_share if pending_share else 1.0
+        return Deadline(self.remaining() * fraction)
+    
+    def request_timeout(self):
+        """
+        Returns:
+            Timeout for the next ORS request, capped by the time remaining
+        """
+        return max(0.1, min(ORS_TIMEOUT_SECONDS, self.remaining()))
+
+class CircuitBreaker:
+    """
+    Circuit breaker for OpenRouteService calls. Tracks the outcome and latency
+    of recent calls; once the error rate or the average latency crosses its
+    threshold the breaker opens and callers should use estimates instead.
+    After the cooldown a single trial call is let through (half-open).
+    """
+    
+    def __init__(self, window=20, min_calls=5, max_error_rate=0.5,
+                 max_latency=5.0, cooldown=60.0):
+        self.calls = deque(maxlen=window)
+        self.min_calls = min_calls
+        self.max_error_rate = max_error_rate
+        self.max_latency = max_latency
+        self.cooldown = cooldown
+        self.opened_at = None
+        self.half_open = False
+    
+    def allow_request(self):
+        """
+        Returns:
+            True if an ORS call should be attempted
+        """
+        if self.opened_at is None:
+            return True
+        if not self.half_open and time.monotonic() - self.opened_at >= self.cooldown:
+            # Half-open: let one trial call decide whether to close again
+            self.half_open = True
+            return True
+        return False
+    
+    def is_open(self):
+        return self.opened_at is not None
+    
+    def record(self, success, latency):
+        """
+        Record the outcome of an ORS call and open the breaker if needed.
+        
+        Args:
+            success: Whether the call returned a usable result
+            latency: Duration of the call in seconds
+        """
+        if self.half_open:
+            self.half_open = False
+            if success and latency <= self.max_latency:
+                self.opened_at = None
+                self.calls.clear()
+            else:
+                self.opened_at = time.monotonic()
+            return
+        
+        self.calls.append((success, latency))
+        if len(self.calls) < self.min_calls:
+            return
+        errors = sum(1 for ok, _ in self.calls if not ok)
+        avg_latency = sum(lat for _, lat in self.calls) / len(self.calls)
+        if errors / len(self.calls) > self.max_error_rate or avg_latency > self.max_latency:
+            self.opened_at = time.monotonic()
+
+class RateLimiter:
+    """
+    Spaces out calls so no more than calls_per_minute are made, matching the
+    per-endpoint quotas of the OpenRouteService API.
+    """
+    
+    def __init__(self, calls_per_minute):
+        self.interval = 60.0 / calls_per_minute
+        self.next_call = 0.0
+    
+    def wait(self):
+        """
+        Block until the next call is allowed.
+        """
+        now = time.monotonic()
+        if now < self.next_call:
+            time.sleep(self.next_call - now)
+            now = self.next_call
+        self.next_call = now + self.interval
+
+# Shared across planning runs so an ORS outage is remembered between reruns
+ors_breaker = CircuitBreaker()
+
+# Persistent caches of ORS results, reused across plans
+geocode_cache = DiskCache('geocode', max_entries=5000)
+route_cache = DiskCache('routes', max_entries=20000)
+
+# Road distance and duration of single legs, from matrix and directions calls
+leg_cache = DiskCache('legs', max_entries=100000)
+
+def _route_key(start_lat, start_lng, end_lat, end_lng):
+    # ~10 m precision, so repeated geocodes of the same city share legs
+    return [round(start_lat, 4), round(start_lng, 4), round(end_lat, 4), round(end_lng, 4)]
+
+def geocode_location(city_name, timeout=ORS_TIMEOUT_SECONDS):
     """
     Geocode a city name to get its coordinates using OpenRouteService API.
     
     Args:
         city_name: Name of the city to geocode
+        timeout: Request timeout in seconds
         
     Returns:
         Tuple of (latitude, longitude) if successful, None otherwise
     """
+    cache_key = city_name.strip().lower()
+    cached = geocode_cache.get(cache_key)
+    if cached:
+        return tuple(cached)
+    
     api_key = os.getenv('ORS_API_KEY')
     if not api_key:
         raise ValueError("ORS_API_KEY not found in environment variables")
@@ -29,21 +212,23 @@ def geocode_location(city_name):
     }
     
     try:
-        response = requests.get(base_url, params=params)
+        response = requests.get(base_url, params=params, timeout=timeout)
         data = response.json()
         
         if 'features' in data and len(data['features']) > 0:
             # Get the coordinates in the format [longitude, latitude]
             coordinates = data['features'][0]['geometry']['coordinates']
             # Return as (latitude, longitude) for consistency with other functions
-            return (coordinates[1], coordinates[0])
+            location = (coordinates[1], coordinates[0])
+            geocode_cache.set(cache_key, location)
+            return location
         else:
             return None
     except Exception as e:
         print(f"Error geocoding location: {e}")
         return None
 
-def get_route_between_locations(start_lat, start_lng, end_lat, end_lng):
+def get_route_between_locations(start_lat, start_lng, end_lat, end_lng, timeout=ORS_TIMEOUT_SECONDS):
     """
     Get a route between two locations using OpenRouteService API.
     
@@ -52,6 +237,7 @@ def get_route_between_locations(start_lat, start_lng, end_lat, end_lng):
         start_lng: Longitude of the starting location
         end_lat: Latitude of the ending location
         end_lng: Longitude of the ending location
+        timeout: Request timeout in seconds
         
     Returns:
         Dictionary with route information including distance, duration, and coordinates
@@ -75,7 +261,7 @@ def get_route_between_locations(start_lat, start_lng, end_lat, end_lng):
     }
     
     try:
-        response = requests.post(base_url, headers=headers, json=data)
+        response = requests.post(base_url, headers=headers, json=data, timeout=timeout)
         result = response.json()
         
         if 'routes' in result and len(result['routes']) > 0:
@@ -89,17 +275,96 @@ def get_route_between_locations(start_lat, start_lng, end_lat, end_lng):
             encoded_polyline = route['geometry']
             coordinates = polyline.decode(encoded_polyline)
             
-            return {
+            route_info = {
                 'distance': distance_km,
                 'duration': duration_sec,
                 'coordinates': coordinates
             }
+            route_cache.set(_route_key(start_lat, start_lng, end_lat, end_lng), route_info)
+            leg_cache.set(_route_key(start_lat, start_lng, end_lat, end_lng),
+                          {'distance': distance_km, 'duration': duration_sec})
+            return route_info
         else:
             return None
     except Exception as e:
         print(f"Error getting route: {e}")
         return None
 
+def get_distance_matrix(coordinates, sources, destinations=None, timeout=ORS_TIMEOUT_SECONDS):
+    """
+    Get road distances and durations from some locations to others in one
+    request to the OpenRouteService matrix API. Every leg returned is cached.
+    
+    Args:
+        coordinates: List of (latitude, longitude) of all locations
+        sources: Indices of the locations to route from
+        destinations: Indices of the locations to route to (default: all)
+        timeout: Request timeout in seconds
+        
+    Returns:
+        Tuple of (distances, durations) with one row per source and one column
+        per destination, in kilometers and seconds, where cells without a
+        route are None; None if the request failed
+    """
+    api_key = os.getenv('ORS_API_KEY')
+    if not api_key:
+        raise ValueError("ORS_API_KEY not found in environment variables")
+    
+    base_url = "https://api.openrouteservice.org/v2/matrix/driving-car"
+    
+    headers = {
+        'Authorization': api_key,
+        'Content-Type': 'application/json'
+    }
+    
+    data = {
+        'locations': [[lng, lat] for lat, lng in coordinates],
+        'sources': sources,
+        'metrics': ['distance', 'duration'],
+        'units': 'km'
+    }
+    if destinations is not None:
+        data['destinations'] = destinations
+    else:
+        destinations = range(len(coordinates))
+    
+    try:
+        response = requests.post(base_url, headers=headers, json=data, timeout=timeout)
+        result = response.json()
+        
+        if 'distances' in result and 'durations' in result:
+            for row, i in enumerate(sources):
+                for column, j in enumerate(destinations):
+                    distance = result['distances'][row][column]
+                    duration = result['durations'][row][column]
+                    if i != j and distance is not None and duration is not None:
+                        leg_cache.set(_route_key(*coordinates[i], *coordinates[j]),
+                                      {'distance': distance, 'duration': duration})
+            return result['distances'], result['durations']
+        else:
+            return None
+    except Exception as e:
+        print(f"Error getting distance matrix: {e}")
+        return None
+
+def get_cached_leg(start_lat, start_lng, end_lat, end_lng):
+    """
+    Look up the road distance and duration of a previously fetched leg.
+    
+    Returns:
+        Dictionary with 'distance' and 'duration', or None if the leg is not cached
+    """
+    return leg_cache.get(_route_key(start_lat, start_lng, end_lat, end_lng))
+
+def get_cached_route(start_lat, start_lng, end_lat, end_lng):
+    """
+    Look up a previously fetched route between two locations.
+    
+    Returns:
+        Dictionary with route information, or None if the leg is not cached
+    """
+    return route_cache.get(_route_key(start_lat, start_lng, end_lat, end_lng))
+
 def haversine_distance(lat1, lon1, lat2, lon2):
     """
     Calculate the great circle distance between two points on the Earth.
@@ -141,22 +406,76 @@ def format_duration(seconds):
     else:
         return f"{int(minutes)}m {int(seconds)}s"
 
-def branch_and_bound_tsp(distance_matrix):
+def nearest_neighbour_tour(distance_matrix):
+    """
+    Build a tour greedily by always moving to the closest unvisited location.
+    Used as the first incumbent for Branch and Bound.
+    
+    Args:
+        distance_matrix: Matrix of distances between all pairs of locations
+        
+    Returns:
+        Tuple of (path, cost) including the return to the depot
+    """
+    n = len(distance_matrix)
+    path = [0]
+    visited = [False] * n
+    visited[0] = True
+    cost = 0
+    
+    for _ in range(n - 1):
+        current = path[-1]
+        next_node = min((j for j in range(n) if not visited[j]),
+                        key=lambda j: distance_matrix[current][j])
+        visited[next_node] = True
+        cost += distance_matrix[current][next_node]
+        path.append(next_node)
+    
+    cost += distance_matrix[path[-1]][0]
+    return path, cost
+
+def branch_and_bound_tsp(distance_matrix, deadline=None):
     """
     Branch and Bound algorithm for the Traveling Salesperson Problem.
     Finds an optimal route visiting all locations starting and ending at the depot.
+    If the deadline expires the search stops and the best tour found so far
+    (the incumbent) is returned.
+    
+    Args:
+        distance_matrix: Matrix of distances between all pairs of locations
+        deadline: Optional Deadline bounding the search
+        
+    Returns:
+        Tuple of (optimal_path, optimal_cost, is_optimal)
+    """
+    search = iter_branch_and_bound_tsp(distance_matrix, deadline)
+    while True:
+        try:
+            optimal_path, optimal_cost = next(search)
+        except StopIteration as stop:
+            return optimal_path, optimal_cost, stop.value
+
+def iter_branch_and_bound_tsp(distance_matrix, deadline=None):
+    """
+    Branch and Bound search as a generator. Yields the best tour found so far
+    as (path, cost), first the nearest-neighbour tour, then whenever it
+    improves and at least every PROGRESS_INTERVAL_SECONDS while searching.
+    Closing the generator cancels the search.
     
     Args:
         distance_matrix: Matrix of distances between all pairs of locations
+        deadline: Optional Deadline bounding the search
         
     Returns:
-        Tuple of (optimal_path, optimal_cost)
+        True if the search finished (the last tour is optimal), False if the deadline expired
     """
     n = len(distance_matrix)  # Number of cities
     
-    # Initialize global variables
-    optimal_path = []
-    optimal_cost = float('inf')
+    # Seed the search with a greedy tour so a feasible answer always exists
+    optimal_path, optimal_cost = nearest_neighbour_tour(distance_matrix)
+    timed_out = False
+    last_report = time.monotonic()
+    yield optimal_path, optimal_cost
     
     # Helper function to calculate the lower bound for a partial path
     def calculate_lower_bound(path, visited):
@@ -180,21 +499,25 @@ def branch_and_bound_tsp(distance_matrix):
                     min_edge = distance_matrix[current][i]
             lb += min_edge
         
-        # Add minimum edge from an unvisited node to depot
-        if n - len(path) > 0:  # If there are unvisited nodes
-            min_edge = float('inf')
-            for i in range(n):
-                if not visited[i] and distance_matrix[i][0] < min_edge:
-                    min_edge = distance_matrix[i][0]
-            lb += min_edge
-        elif len(path) == n:  # All nodes visited, add cost to return to depot
+        # The edge back to the depot leaves an unvisited node, so it is
+        # already covered by that node's minimum outgoing edge
+        if len(path) == n:  # All nodes visited, add cost to return to depot
             lb += distance_matrix[current][0]
             
         return lb
     
     # Recursive branch and bound function
     def branch_and_bound(path, cost, visited):
-        nonlocal optimal_path, optimal_cost
+        nonlocal optimal_path, optimal_cost, timed_out, last_report
+        
+        if timed_out:
+            return
+        if deadline is not None and deadline.expired():
+            timed_out = True
+            return
+        if time.monotonic() - last_report >= PROGRESS_INTERVAL_SECONDS:
+            last_report = time.monotonic()
+            yield optimal_path, optimal_cost
         
         # If all nodes have been visited
         if len(path) == n:
@@ -203,6 +526,8 @@ def branch_and_bound_tsp(distance_matrix):
             if total_cost < optimal_cost:
                 optimal_cost = total_cost
                 optimal_path = path.copy()  # Make a copy of the path
+                last_report = time.monotonic()
+                yield optimal_path, optimal_cost
             return
         
         # Calculate lower bound for current partial path
@@ -221,78 +546,181 @@ def branch_and_bound_tsp(distance_matrix):
                 
                 # Recurse only if the new cost doesn't exceed optimal_cost
                 if new_cost < optimal_cost:
-                    branch_and_bound(path + [next_node], new_cost, visited)
+                    yield from branch_and_bound(path + [next_node], new_cost, visited)
                 
                 visited[next_node] = False
     
     # Start from the depot (node 0)
     visited = [False] * n
     visited[0] = True
-    branch_and_bound([0], 0, visited)
+    yield from branch_and_bound([0], 0, visited)
     
-    # If we found a solution, add the return to depot
-    if optimal_path:
-        return optimal_path, optimal_cost
-    else:
-        # Fallback to simple ordering if no solution found
-        return list(range(n)), float('inf')
+    return not timed_out
 
-def calculate_shortest_paths_dijkstra(locations):
+def estimate_route_between_locations(start_lat, start_lng, end_lat, end_lng):
     """
-    Calculate shortest paths between all locations using real-world routing,
-    then optimize the route using Branch and Bound for TSP.
+    Estimate a route between two locations from the haversine distance.
+    Used whenever OpenRouteService cannot be queried.
+    
+    Returns:
+        Dictionary with route information including distance, duration, and coordinates
+    """
+    dist = haversine_distance(start_lat, start_lng, end_lat, end_lng)
+    return {
+        'distance': dist,
+        'duration': dist * 60,  # Rough estimate: 1 km takes 60 seconds
+        'coordinates': []
+    }
+
+def iter_route_matrix(locations, deadline=None, breaker=ors_breaker):
+    """
+    Get road distances and durations between all pairs of locations. Legs
+    cached by earlier plans or the cache warming job are reused; the rows
+    with missing legs are requested from the ORS matrix API, a block of rows
+    per request. Legs that cannot be fetched in time, or while the ORS
+    circuit breaker is open, come from previously fetched routes where
+    possible and otherwise fall back to haversine estimates. Route geometry
+    is not fetched; see iter_route_geometry.
+    
+    Yields a progress event {'stage': 'matrix', 'progress': share of rows done}
+    after each request.
     
     Args:
-        locations: List of location dictionaries, starting with the origin
+        locations: List of location dictionaries
+        deadline: Optional Deadline for the matrix stage
+        breaker: CircuitBreaker guarding ORS calls
         
     Returns:
-        Tuple of (shortest_paths, total_distance, ordered_visits, route_coordinates, total_duration)
+        Tuple of (shortest_paths, approximations) where approximations is a
+        dictionary with the estimated legs ('estimated_legs') and whether the
+        circuit breaker was open ('ors_unavailable')
     """
     n = len(locations)
+    if deadline is None:
+        deadline = Deadline()
+    
+    approximations = {
+        'estimated_legs': [],
+        'ors_unavailable': False
+    }
     
     # Create a matrix to store distances and durations between all locations
     shortest_paths = [[None for _ in range(n)] for _ in range(n)]
+    coordinates = [(loc['lat'], loc['lng']) for loc in locations]
     
-    # Calculate distances and durations between all pairs of locations
     for i in range(n):
         for j in range(n):
             if i != j:
-                route = get_route_between_locations(
-                    locations[i]['lat'], locations[i]['lng'],
-                    locations[j]['lat'], locations[j]['lng']
-                )
+                leg = get_cached_leg(*coordinates[i], *coordinates[j])
+                if leg:
+                    shortest_paths[i][j] = {
+                        'distance': leg['distance'],
+                        'duration': leg['duration'],
+                        'coordinates': []
+                    }
+    
+    missing_rows = [i for i in range(n) if any(shortest_paths[i][j] is None for j in range(n) if j != i)]
+    rows_per_request = max(1, ORS_MATRIX_MAX_CELLS // max(n, 1))
+    
+    for first in range(0, len(missing_rows), rows_per_request):
+        sources = missing_rows[first:first + rows_per_request]
+        matrix = None
+        if not deadline.expired() and breaker.allow_request():
+            started = time.monotonic()
+            matrix = get_distance_matrix(coordinates, sources, timeout=deadline.request_timeout())
+            breaker.record(matrix is not None, time.monotonic() - started)
+        
+        for row, i in enumerate(sources):
+            for j in range(n):
+                if i == j or shortest_paths[i][j] is not None:
+                    continue
+                distance = matrix[0][row][j] if matrix else None
+                duration = matrix[1][row][j] if matrix else None
+                if distance is None or duration is None:
+                    # A route fetched for an earlier plan still has the road figures
+                    route = get_cached_route(*coordinates[i], *coordinates[j])
+                    if route:
+                        distance, duration = route['distance'], route['duration']
                 
-                if route:
+                if distance is not None and duration is not None:
                     shortest_paths[i][j] = {
-                        'distance': route['distance'],
-                        'duration': route['duration'],
-                        'coordinates': route['coordinates']
+                        'distance': distance,
+                        'duration': duration,
+                        'coordinates': []
                     }
                 else:
-                    # If route couldn't be fetched, use haversine distance as fallback
-                    dist = haversine_distance(
+                    # If the leg couldn't be fetched, use haversine distance as fallback
+                    shortest_paths[i][j] = estimate_route_between_locations(
                         locations[i]['lat'], locations[i]['lng'],
                         locations[j]['lat'], locations[j]['lng']
                     )
-                    shortest_paths[i][j] = {
-                        'distance': dist,
-                        'duration': dist * 60,  # Rough estimate: 1 km takes 60 seconds
-                        'coordinates': []
-                    }
+                    approximations['estimated_legs'].append((locations[i]['city'], locations[j]['city']))
+        
+        yield {'stage': 'matrix', 'progress': (first + len(sources)) / len(missing_rows)}
     
-    # Create distance matrix for Branch and Bound TSP
-    distance_matrix = [[shortest_paths[i][j]['distance'] if i != j else 0 for j in range(n)] for i in range(n)]
+    approximations['ors_unavailable'] = breaker.is_open()
+    return shortest_paths, approximations
+
+def iter_route_geometry(shortest_paths, locations, ordered_indices, deadline=None, breaker=ors_breaker):
+    """
+    Fetch the road geometry of the legs of a route, from the route cache or
+    from ORS directions, into shortest_paths. Legs keep the distance and
+    duration the route was optimized with. Legs that cannot be fetched in
+    time, or while the ORS circuit breaker is open, keep no geometry.
     
-    # Solve TSP using Branch and Bound
-    optimal_path, _ = branch_and_bound_tsp(distance_matrix)
+    Yields a progress event {'stage': 'geometry', 'progress': share of legs done}
+    after each leg.
     
-    # Check if optimal path was found (should always be the case now with the fallback)
-    ordered_indices = optimal_path
     
+    Args:
+        shortest_paths: Matrix of routes between all locations
+        locations: List of location dictionaries
+        ordered_indices: Indices of the locations in visiting order
+        deadline: Optional Deadline for the geometry stage
+        breaker: CircuitBreaker guarding ORS calls
+    """
+    if deadline is None:
+        deadline = Deadline()
+    
+    legs = list(zip(ordered_indices[:-1], ordered_indices[1:]))
+    
+    for done, (i, j) in enumerate(legs, start=1):
+        route = get_cached_route(
+            locations[i]['lat'], locations[i]['lng'],
+            locations[j]['lat'], locations[j]['lng']
+        )
+        if route is None and not deadline.expired() and breaker.allow_request():
+            started = time.monotonic()
+            route = get_route_between_locations(
+                locations[i]['lat'], locations[i]['lng'],
+                locations[j]['lat'], locations[j]['lng'],
+                timeout=deadline.request_timeout()
+            )
+            breaker.record(route is not None, time.monotonic() - started)
+        
+        if route:
+            shortest_paths[i][j] = dict(shortest_paths[i][j], coordinates=route['coordinates'])
+        
+        yield {'stage': 'geometry', 'progress': done / len(legs)}
+
+def summarize_route(shortest_paths, locations, ordered_indices):
+    """
+    Total up a route and join the geometry of its legs.
+    
+    Args:
+        shortest_paths: Matrix of routes between all locations
+        locations: List of location dictionaries
+        ordered_indices: Indices of the locations in visiting order
+        
+    Returns:
+        Tuple of (total_distance, ordered_visits, route_coordinates, total_duration)
+        where route_coordinates is an (N, 2) array of (latitude, longitude);
+        legs without road geometry are drawn as straight lines
+    """
     # Calculate total distance and collect coordinates for the entire route
     total_distance = 0
     total_duration = 0
-    route_coordinates = []
+    route_segments = []
     ordered_visits = [locations[i] for i in ordered_indices]
     
     for i in range(len(ordered_indices) - 1):
@@ -303,7 +731,202 @@ def calculate_shortest_paths_dijkstra(locations):
         total_duration += shortest_paths[from_idx][to_idx]['duration']
         
         coords = shortest_paths[from_idx][to_idx]['coordinates']
-        if coords:
-            route_coordinates.extend(coords)
+        if len(coords):
+            route_segments.append(np.asarray(coords, dtype=float))
+        else:
+            route_segments.append(np.array([
+                [locations[from_idx]['lat'], locations[from_idx]['lng']],
+                [locations[to_idx]['lat'], locations[to_idx]['lng']]
+            ], dtype=float))
+    
+    # Concatenate once instead of growing a list of tuples leg by leg
+    route_coordinates = np.concatenate(route_segments) if route_segments else np.empty((0, 2))
+    
+    return total_distance, ordered_visits, route_coordinates, total_duration
+
+def run_pipeline(events):
+    """
+    Run a planning pipeline to the end, ignoring its progress events.
+    
+    Args:
+        events: Generator from iter_shortest_paths_dijkstra or iter_prize_collecting_route
+        
+    Returns:
+        Result of the final event
+    """
+    result = None
+    for event in events:
+        if 'result' in event:
+            result = event['result']
+    return result
+
+def _iter_route_results(search, deadline, shortest_paths, locations, approximations):
+    """
+    Turn the tours yielded by a solver generator into 'solver' events
+    carrying a full route result. The route is only re-summarized when the
+    tour changes.
+    
+    Returns:
+        Tuple of (last tour, the solver's return value)
+    """
+    last_tour, result = None, None
+    while True:
+        try:
+            tour = list(next(search)[0])
+        except StopIteration as stop:
+            return last_tour, stop.value
+        if tour != last_tour:
+            last_tour = tour
+            result = _route_result(shortest_paths, locations, tour, dict(approximations, route_optimal=False))
+        yield {'stage': 'solver', 'progress': deadline.fraction_used(), 'result': result}
+
+def _route_result(shortest_paths, locations, ordered_indices, approximations):
+    total_distance, ordered_visits, route_coordinates, total_duration = summarize_route(shortest_paths, locations, ordered_indices)
+    # Interim routes have no road geometry yet; list every leg drawn straight
+    approximations['missing_geometry'] = [
+        (locations[i]['city'], locations[j]['city'])
+        for i, j in zip(ordered_indices[:-1], ordered_indices[1:])
+        if not len(shortest_paths[i][j]['coordinates'])
+    ]
+    return shortest_paths, total_distance, ordered_visits, route_coordinates, total_duration, approximations
+
+def calculate_shortest_paths_dijkstra(locations, deadline=None, breaker=ors_breaker):
+    """
+    Calculate shortest paths between all locations using real-world routing,
+    then optimize the route using Branch and Bound for TSP.
+    
+    Distances and durations come from the ORS matrix API; road geometry is
+    only fetched for the legs of the final route. When a deadline is given,
+    the matrix, the TSP search and the geometry each get their share of it.
+    Legs that cannot be fetched in time, or while the ORS circuit breaker is
+    open, fall back to haversine estimates or straight lines.
+    
+    Args:
+        locations: List of location dictionaries, starting with the origin
+        deadline: Optional Deadline for the whole plan
+        breaker: CircuitBreaker guarding ORS calls
+        
+    Returns:
+        Tuple of (shortest_paths, total_distance, ordered_visits, route_coordinates, total_duration, approximations)
+        where route_coordinates is an (N, 2) array of (latitude, longitude) and
+        approximations is a dictionary with the estimated legs ('estimated_legs'),
+        the legs without road geometry ('missing_geometry'), whether the route
+        order is optimal ('route_optimal') and whether the circuit breaker was
+        open ('ors_unavailable')
+    """
+    return run_pipeline(iter_shortest_paths_dijkstra(locations, deadline, breaker))
+
+def iter_shortest_paths_dijkstra(locations, deadline=None, breaker=ors_breaker):
+    """
+    calculate_shortest_paths_dijkstra as a stream of events, so callers can
+    show progress and act on the best route found so far. Closing the
+    generator cancels the remaining work.
+    
+    Events are dictionaries with a 'stage' and a 'progress' share (None if
+    unknown):
+    
+    - 'matrix': after each block of the distance matrix is fetched or estimated
+    - 'solver': whenever the best tour improves, and periodically while the
+      search runs; 'result' holds the route so far, with 'route_optimal' False
+    - 'geometry': after the road geometry of each leg of the final route
+    - 'done': once, at the end; 'result' holds the final route
+    
+    Args:
+        locations: List of location dictionaries, starting with the origin
+        deadline: Optional Deadline for the whole plan
+        breaker: CircuitBreaker guarding ORS calls
+        
+    Yields:
+        Event dictionaries; 'result' has the same layout as the return value
+        of calculate_shortest_paths_dijkstra
+    """
+    n = len(locations)
+    if deadline is None:
+        deadline = Deadline()
+    
+    shortest_paths, approximations = yield from iter_route_matrix(locations, deadline.stage('matrix'), breaker)
+    
+    # Create distance matrix for Branch and Bound TSP
+    distance_matrix = [[shortest_paths[i][j]['distance'] if i != j else 0 for j in range(n)] for i in range(n)]
+    
+    # Solve TSP using Branch and Bound within the remaining budget
+    solver_deadline = deadline.stage('solver')
+    search = iter_branch_and_bound_tsp(distance_matrix, solver_deadline)
+    optimal_path, is_optimal = yield from _iter_route_results(search, solver_deadline, shortest_paths, locations, approximations)
+    
+    # Road geometry only for the legs actually driven
+    yield from iter_route_geometry(shortest_paths, locations, optimal_path, deadline.stage('geometry'), breaker)
+    
+    result = _route_result(shortest_paths, locations, optimal_path, dict(approximations, route_optimal=is_optimal))
+    yield {'stage': 'done', 'progress': 1.0, 'result': result}
+
+def calculate_prize_collecting_route(locations, max_weight, cost_per_km, cost_per_hour,
+                                     deadline=None, breaker=ors_breaker):
+    """
+    Choose which parcels to deliver and in what order in one optimization,
+    maximizing the delivered value minus the travel cost under the weight
+    capacity (prize-collecting TSP).
+    
+    Unlike selecting parcels first and routing them afterwards, a valuable
+    parcel far off the route is only taken if its value covers the detour.
+    
+    Args:
+        locations: List of location dictionaries, starting with the origin;
+                   parcel locations carry 'weight' and 'value'
+        max_weight: Maximum total weight that can be carried
+        cost_per_km: Travel cost per kilometer
+        cost_per_hour: Travel cost per hour of driving
+        deadline: Optional Deadline for the whole plan
+        breaker: CircuitBreaker guarding ORS calls
+        
+    Returns:
+        Tuple of (shortest_paths, total_distance, ordered_visits, route_coordinates, total_duration, approximations)
+        as calculate_shortest_paths_dijkstra, where ordered_visits only holds
+        the depot and the chosen parcels and 'route_optimal' tells whether the
+        search finished before the deadline
+    """
+    return run_pipeline(iter_prize_collecting_route(locations, max_weight, cost_per_km, cost_per_hour, deadline, breaker))
+
+def iter_prize_collecting_route(locations, max_weight, cost_per_km, cost_per_hour,
+                                deadline=None, breaker=ors_breaker):
+    """
+    calculate_prize_collecting_route as a stream of events, with the same
+    events as iter_shortest_paths_dijkstra.
+    
+    Args:
+        locations: List of location dictionaries, starting with the origin
+        max_weight: Maximum total weight that can be carried
+        cost_per_km: Travel cost per kilometer
+        cost_per_hour: Travel cost per hour of driving
+        deadline: Optional Deadline for the whole plan
+        breaker: CircuitBreaker guarding ORS calls
+        
+    Yields:
+        Event dictionaries; 'result' has the same layout as the return value
+        of calculate_prize_collecting_route
+    """
+    n = len(locations)
+    if deadline is None:
+        deadline = Deadline()
+    
+    shortest_paths, approximations = yield from iter_route_matrix(locations, deadline.stage('matrix'), breaker)
+    
+    # Travel cost of every leg in the same currency as the parcel values
+    cost_matrix = np.zeros((n, n))
+    for i in range(n):
+        for j in range(n):
+            if i != j:
+                cost_matrix[i][j] = (cost_per_km * shortest_paths[i][j]['distance']
+                                     + cost_per_hour * shortest_paths[i][j]['duration'] / 3600)
+    
+    values = [loc.get('value', 0) for loc in locations]
+    weights = [loc.get('weight', 0) for loc in locations]
+    solver_deadline = deadline.stage('solver')
+    search = iter_prize_collecting_tour(cost_matrix, values, weights, max_weight, solver_deadline)
+    tour, finished = yield from _iter_route_results(search, solver_deadline, shortest_paths, locations, approximations)
+    
+    # Road geometry only for the legs actually driven
+    yield from iter_route_geometry(shortest_paths, locations, tour, deadline.stage('geometry'), breaker)
     
-    return shortest_paths, total_distance, ordered_visits, route_coordinates, total_duration
\ No newline at end of file
+    result = _route_result(shortest_paths, locations, tour, dict(approximations, route_optimal=finished))
+    yield {'stage': 'done', 'progress': 1.0, 'result': result}
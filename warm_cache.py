@@ -0,0 +1,234 @@
+"""
+Prefetch geocodes and the distance matrix rows between depots and frequent
+destinations into the persistent caches the app reads, so the first plans of
+the day run as fast as warm ones. Route geometry from the depots can be
+prefetched too.
+
+Run it before dispatchers start, e.g. from cron:
+
+    30 5 * * * cd /path/to/app && python warm_cache.py --manifests manifests/ --since-days 7
+"""
+import os
+import time
+import argparse
+from collections import Counter
+import pandas as pd
+from dotenv import load_dotenv
+from utils.routing import (
+    geocode_location,
+    get_distance_matrix,
+    get_route_between_locations,
+    get_cached_leg,
+    get_cached_route,
+    geocode_cache,
+    RateLimiter,
+    ORS_MATRIX_MAX_CELLS
+)
+
+# OpenRouteService free-tier quotas (requests per minute)
+GEOCODE_CALLS_PER_MINUTE = 100
+MATRIX_CALLS_PER_MINUTE = 40
+DIRECTIONS_CALLS_PER_MINUTE = 40
+
+def find_manifests(paths, since_days=None):
+    """
+    Collect manifest CSV files from files and directories.
+
+    Args:
+        paths: List of CSV files or directories containing CSV files
+        since_days: Only include files modified in the last this many days
+
+    Returns:
+        List of CSV file paths
+    """
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(os.path.join(path, name) for name in sorted(os.listdir(path)) if name.endswith('.csv'))
+        else:
+            files.append(path)
+
+    if since_days is not None:
+        cutoff = time.time() - since_days * 86400
+        files = [f for f in files if os.path.getmtime(f) >= cutoff]
+    return files
+
+def count_destinations(manifest_files, cities):
+    """
+    Count how often each city appears as a destination. Names are compared
+    case-insensitively, like the geocode cache.
+
+    Args:
+        manifest_files: List of manifest CSV paths with a 'city' column
+        cities: Additional city names, counted once each
+
+    Returns:
+        Counter of city names
+    """
+    counts = Counter()
+    for path in manifest_files:
+        try:
+            manifest = pd.read_csv(path)
+        except Exception as e:
+            print(f"Error reading manifest {path}: {e}")
+            continue
+        if 'city' not in manifest.columns:
+            print(f"Skipping manifest without a city column: {path}")
+            continue
+        counts.update(str(city).strip().lower() for city in manifest['city'].dropna())
+    counts.update(city.strip().lower() for city in cities)
+    return counts
+
+def warm_geocodes(cities, limiter):
+    """
+    Geocode cities, only calling the API for those not cached yet.
+
+    Args:
+        cities: List of city names
+        limiter: RateLimiter for the geocoding endpoint
+
+    Returns:
+        Dictionary mapping city names to (latitude, longitude)
+    """
+    locations = {}
+    for city in cities:
+        if geocode_cache.get(city.strip().lower()) is None:
+            limiter.wait()
+        location = geocode_location(city)
+        if location:
+            locations[city] = location
+        else:
+            print(f"Could not geocode city: {city}")
+    return locations
+
+def _fetch_matrix_rows(coordinates, sources, destinations, limiter):
+    """
+    Request matrix rows in blocks that fit one ORS request; the legs are
+    cached by get_distance_matrix.
+
+    Returns:
+        Number of rows whose request failed
+    """
+    failed = 0
+    rows_per_request = max(1, ORS_MATRIX_MAX_CELLS // len(destinations))
+    for first in range(0, len(sources), rows_per_request):
+        block = sources[first:first + rows_per_request]
+        limiter.wait()
+        if get_distance_matrix(coordinates, block, destinations) is None:
+            failed += len(block)
+    return failed
+
+def warm_matrix(depots, destinations, locations, limiter):
+    """
+    Fetch the distance matrix legs from each depot to every depot and
+    destination, and back from each destination to the depots, skipping
+    rows whose legs are all cached.
+
+    Args:
+        depots: List of depot city names
+        destinations: List of destination city names
+        locations: Dictionary mapping city names to (latitude, longitude)
+        limiter: RateLimiter for the matrix endpoint
+
+    Returns:
+        Tuple of (fetched, cached, failed) row counts
+    """
+    depots = [city for city in depots if city in locations]
+    cities = list(dict.fromkeys(depots + [city for city in destinations if city in locations]))
+    if not depots or len(cities) < 2:
+        return 0, 0, 0
+    coordinates = [locations[city] for city in cities]
+    depot_indices = list(range(len(depots)))
+    destination_indices = list(range(len(depots), len(cities)))
+
+    def missing(sources, targets):
+        return [i for i in sources
+                if any(i != j and get_cached_leg(*coordinates[i], *coordinates[j]) is None for j in targets)]
+
+    fetched = cached = failed = 0
+    all_indices = list(range(len(cities)))
+    for sources, targets in ((depot_indices, all_indices), (destination_indices, depot_indices)):
+        rows = missing(sources, targets)
+        cached += len(sources) - len(rows)
+        if rows:
+            row_failures = _fetch_matrix_rows(coordinates, rows, targets, limiter)
+            fetched += len(rows) - row_failures
+            failed += row_failures
+    return fetched, cached, failed
+
+def warm_geometry(depots, destinations, locations, limiter):
+    """
+    Fetch the road geometry of the legs from each depot to each destination,
+    skipping legs already cached. Plans start at a depot, so these are the
+    first legs the app draws.
+
+    Args:
+        depots: List of depot city names
+        destinations: List of destination city names
+        locations: Dictionary mapping city names to (latitude, longitude)
+        limiter: RateLimiter for the directions endpoint
+
+    Returns:
+        Tuple of (fetched, cached, failed) leg counts
+    """
+    fetched = cached = failed = 0
+    for depot in depots:
+        for destination in destinations:
+            if depot not in locations or destination not in locations or depot == destination:
+                continue
+            start_lat, start_lng = locations[depot]
+            end_lat, end_lng = locations[destination]
+            if get_cached_route(start_lat, start_lng, end_lat, end_lng):
+                cached += 1
+                continue
+            limiter.wait()
+            if get_route_between_locations(start_lat, start_lng, end_lat, end_lng):
+                fetched += 1
+            else:
+                failed += 1
+    return fetched, cached, failed
+
+def main():
+    parser = argparse.ArgumentParser(description="Prefetch geocodes and depot routes into the persistent caches.")
+    parser.add_argument('--manifests', nargs='*', default=[],
+                        help="Manifest CSV files or directories of them (needs a 'city' column)")
+    parser.add_argument('--since-days', type=float, default=None,
+                        help="Only read manifests modified in the last this many days")
+    parser.add_argument('--cities', nargs='*', default=[],
+                        help="Additional destination cities")
+    parser.add_argument('--depots', nargs='*', default=None,
+                        help="Depot cities (default: DEPOT_CITIES environment variable, comma-separated)")
+    parser.add_argument('--top', type=int, default=50,
+                        help="Number of most frequent destinations to fetch depot matrix rows for")
+    parser.add_argument('--geometry', action='store_true',
+                        help="Also prefetch the road geometry from each depot to the top destinations")
+    args = parser.parse_args()
+
+    load_dotenv()
+    depots = args.depots
+    if depots is None:
+        depots = os.getenv('DEPOT_CITIES', '').split(',')
+    depots = [city.strip().lower() for city in depots if city.strip()]
+
+    counts = count_destinations(find_manifests(args.manifests, args.since_days), args.cities)
+    if not counts and not depots:
+        parser.error("no destinations or depots given")
+
+    # Geocode every destination seen, not only the top ones; geocodes are cheap
+    destinations = [city for city, _ in counts.most_common()]
+    locations = warm_geocodes(list(dict.fromkeys(depots + destinations)),
+                              RateLimiter(GEOCODE_CALLS_PER_MINUTE))
+    print(f"Geocoded {len(locations)} of {len(set(depots + destinations))} cities")
+
+    top_destinations = destinations[:args.top]
+    fetched, cached, failed = warm_matrix(depots, top_destinations, locations,
+                                          RateLimiter(MATRIX_CALLS_PER_MINUTE))
+    print(f"Matrix rows: {fetched} fetched, {cached} already cached, {failed} failed")
+
+    if args.geometry:
+        fetched, cached, failed = warm_geometry(depots, top_destinations, locations,
+                                                RateLimiter(DIRECTIONS_CALLS_PER_MINUTE))
+        print(f"Route geometry: {fetched} fetched, {cached} already cached, {failed} failed")
+
+if __name__ == "__main__":
+    main()